@@ -61,6 +61,15 @@ CSV_SENSOR_MAP = {
     CarSensorID.GPS.LONGITUDE: ' Longitude',
 }
 
+CSV_SENSOR_COLUMNS = tuple(CSV_SENSOR_MAP.values())
+CSV_DATE_COLUMN = CSV_SENSOR_MAP[CarSensorID.DATE]
+CSV_SENSOR_DTYPES = {
+    column: (str if column == CSV_DATE_COLUMN else 'float64')
+    for column in CSV_SENSOR_COLUMNS
+}
+CSV_NA_VALUES = ['-']
+CSV_DATE_FORMAT = '%d-%b-%Y %H:%M:%S.%f'
+
 
 class BatteryLevel:
     MIN = 13.5
@@ -3,8 +3,12 @@ Authentication controller
 """
 import jwt
 import datetime
+import os
+import threading
 
 from bcrypt import checkpw, gensalt, hashpw
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from gevent import monkey
 from marshmallow import ValidationError
 
 from app.config import Config
@@ -13,6 +17,22 @@ from app.controllers.user import UserController
 from app.utils.exceptions import DictException
 from app.validators.auth import LoginSchema
 
+if monkey.is_module_patched('threading'):
+    # Under gevent workers only gevent's pool runs tasks on native threads instead of greenlets
+    from gevent.threadpool import ThreadPoolExecutor
+else:
+    from concurrent.futures import ThreadPoolExecutor
+
+
+# bcrypt releases the GIL, so hashing on native threads keeps the worker serving other requests meanwhile
+HASH_WORKERS = os.cpu_count() or 1
+HASH_POOL = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+HASH_GATE = threading.BoundedSemaphore(HASH_WORKERS * 2)
+HASH_TIMEOUT = 2
+
+# Checked against when the user does not exist, so that login takes the same time either way
+DUMMY_PASSWORD_HASH = hashpw(b'dummy-password', gensalt())
+
 
 class AuthControllerException(DictException):
     """ Exception class for AuthController class """
@@ -23,6 +43,38 @@ class AuthController(object):
     """
     Controller for authentication related data.
     """
+    def _check_password(self, password: str, hashed_password: bytes):
+        """
+        Checks <password> against <hashed_password> on the hashing pool.
+        At most <HASH_WORKERS> * 2 checks may be running or queued at once (including checks whose caller
+        timed out), further attempts are refused.
+
+        Raises:
+            - AuthControllerException: If the pool is saturated or the check times out.
+
+        Args:
+            - password (str): Plain text password;
+            - hashed_password (bytes): bcrypt hash to check against.
+
+        Returns:
+            - (bool): Whether the password matches the hash.
+        """
+        if not HASH_GATE.acquire(blocking=False):
+            raise AuthControllerException({'unavailable': 'Too many login attempts, try again later'})
+
+        try:
+            future = HASH_POOL.submit(checkpw, password.encode('utf8'), hashed_password)
+        except Exception:
+            HASH_GATE.release()
+            raise
+
+        # The permit is held until the check actually finishes, even if we stop waiting for it
+        future.add_done_callback(lambda _: HASH_GATE.release())
+        try:
+            return future.result(timeout=HASH_TIMEOUT)
+        except FutureTimeoutError:
+            raise AuthControllerException({'unavailable': 'Too many login attempts, try again later'})
+
     def login(self, data):
         validator = LoginSchema()
         try:
@@ -31,9 +83,9 @@ class AuthController(object):
             raise AuthControllerException(error.messages)
 
         user: User = UserController().get_user(email=loaded_data['email'])
-        try:
-            assert checkpw(loaded_data['password'].encode('utf8'), user.password)
-        except (AssertionError, AttributeError):
+        hashed_password = user.password if user else DUMMY_PASSWORD_HASH
+        is_valid = self._check_password(loaded_data['password'], hashed_password)
+        if not (user and is_valid):
             raise AuthControllerException({'invalid': 'Incorrect user and/or password'})
 
         return user
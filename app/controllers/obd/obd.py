@@ -2,14 +2,25 @@
 OBD Controller
 """
 import datetime
+import itertools
+import logging
 import pandas
 import re
+import threading
 
-from io import StringIO
+from cachetools import TTLCache
+from collections import namedtuple
+from sqlalchemy import exists
 from typing import List
 from structlog import get_logger
 
-from app.constants.obd import CarSensorID, CSV_SENSOR_MAP
+from app.constants.obd import (
+    CSV_DATE_COLUMN,
+    CSV_DATE_FORMAT,
+    CSV_NA_VALUES,
+    CSV_SENSOR_COLUMNS,
+    CSV_SENSOR_DTYPES,
+)
 from app.controllers import BaseController
 from app.controllers.obd.session import SessionController
 from app.models.obd.car import CarState
@@ -19,6 +30,18 @@ from app.models.user import User
 
 LOGGER = get_logger(__name__)
 
+# TORQUE sends sensor metadata (names, units) under keys such as 'userUnit0d' or 'defaultUnit0d'.
+NON_VALUE_KEY_PATTERN = re.compile('unit|user', re.IGNORECASE)
+
+# TORQUE posts several times per second on behalf of the same few users, so their lookups are cached by email.
+USER_CACHE = TTLCache(maxsize=1024, ttl=300)
+USER_CACHE_LOCK = threading.Lock()
+
+ResolvedUser = namedtuple('ResolvedUser', ['id', 'first_name', 'last_name'])
+
+# TORQUE device times are naive, epochs derived from them read them as UTC (see CarState.create_from_csv)
+EPOCH = datetime.datetime(1970, 1, 1)
+
 
 class OBDControllerError(Exception):
     """ Exception class for OBD Controller """
@@ -30,15 +53,47 @@ class OBDController(BaseController):
     Controller class for OBD-related data manipulations.
     """
     SENSOR_CONTROLLER_CLASSES = []
+    CSV_CHUNK_SIZE = 50000
 
     def _resolve_date_from_csv_row(self, csv_row: dict):
         """ Resolves a datetime from a certain row in a CSV """
-        date_str = csv_row[CSV_SENSOR_MAP[CarSensorID.DATE]]
-        return datetime.datetime.strptime(date_str, '%d-%b-%Y %H:%M:%S.%f')
+        date_str = csv_row[CSV_DATE_COLUMN]
+        return datetime.datetime.strptime(date_str, CSV_DATE_FORMAT)
+
+    def _read_csv_chunks(self, csv_stream):
+        """
+        Reads the sensor columns of a TORQUE generated CSV in chunks of <CSV_CHUNK_SIZE> rows.
+        Column types are declared upfront so the C parser does not have to infer them,
+        and TORQUE's '-' placeholders are read as missing values.
+
+        Raises:
+            - OBDControllerError: If a sensor column holds a non-numeric value.
+
+        Args:
+            - csv_stream (BinaryIO): Byte stream of the CSV file created by TORQUE.
+
+        Returns:
+            - (Iterator[pandas.DataFrame]): CSV chunks.
+        """
+        reader = pandas.read_csv(
+            csv_stream,
+            usecols=CSV_SENSOR_COLUMNS,
+            dtype=CSV_SENSOR_DTYPES,
+            na_values=CSV_NA_VALUES,
+            chunksize=self.CSV_CHUNK_SIZE,
+            encoding='utf-8',
+            engine='c',
+        )
+        try:
+            yield from reader
+        except ValueError as err:
+            raise OBDControllerError(f'CSV contains invalid sensor values: {err}')
 
     def _resolve_user(self, data: dict):
         """
         Resolves user from data.
+        Users are looked up by email and kept in <USER_CACHE> for a few minutes,
+        so subsequent TORQUE requests for the same user do not hit the database.
 
         Raises:
             - OBDControllerError:
@@ -49,15 +104,30 @@ class OBDController(BaseController):
             - data (dict): Map of arguments received by TORQUE request.
 
         Returns:
-            - user (app.models.user.User): User instance.
+            - user (ResolvedUser): Id and name of the user.
         """
         user_email = data.get('eml')
         if not user_email:
             raise OBDControllerError('User email not found')
 
-        user: User = self.db_session.query(User).filter(User.email == user_email).first()
-        if not user:
-            raise OBDControllerError('User does not exist')
+        # Emails are stored normalized, see app.validators.user.BasicUserSchema
+        user_email = user_email.strip().lower()
+
+        with USER_CACHE_LOCK:
+            user = USER_CACHE.get(user_email)
+
+        if user is None:
+            row = (
+                self.db_session.query(User.id, User.first_name, User.last_name)
+                                .filter(User.email == user_email)
+                                .first()
+            )
+            if not row:
+                raise OBDControllerError('User does not exist')
+
+            user = ResolvedUser(*row)
+            with USER_CACHE_LOCK:
+                USER_CACHE[user_email] = user
 
         return user
 
@@ -70,8 +140,9 @@ class OBDController(BaseController):
         Args:
             - data (dict): Data to be processed.
         """
-        LOGGER.info('Receiving sensor data from TORQUE', **data)
-        has_non_value_keys = any(filter(re.compile(f'.*(unit|user).*', re.IGNORECASE).match, data.keys()))
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info('Receiving sensor data from TORQUE', **data)
+        has_non_value_keys = any(NON_VALUE_KEY_PATTERN.search(key) for key in data)
         if has_non_value_keys:
             LOGGER.info('Will ignore request since it\'s related to sensor params')
             return
@@ -79,35 +150,50 @@ class OBDController(BaseController):
         user = self._resolve_user(data)
         LOGGER.info(f'Request is attached to {user.first_name} {user.last_name}', user_id=user.id)
         session = SessionController(user_id=user.id).get_or_create(data['session'])
-        LOGGER.info('Resolved session to proceed', **session.to_dict())
+        LOGGER.info('Resolved session to proceed', session_id=session.id, user_id=session.user_id, date=session.date)
 
         car_state = CarState.create_from_torque(self.db_session, session, data)
         if car_state:
-            LOGGER.info('Created Car State', **car_state.to_dict())
+            if LOGGER.isEnabledFor(logging.INFO):
+                LOGGER.info('Created Car State', **car_state.to_dict())
             self.db_session.commit()
 
     def process_csv(self, user: User, csv_file):
         """
         Will process a CSV file generated by the TORQUE application, registering the values for each
         considered sensor in the database.
+        The file is streamed in chunks of <CSV_CHUNK_SIZE> rows, so memory usage is bound by the chunk size
+        rather than by the size of the upload.
 
         Args:
             - user (app.models.user.User): User instance;
             - csv_file (werkzeug.FileStorage): A file representation of the CSV file created by TORQUE.
         """
         self.db_session.rollback()
-        csv = pandas.read_csv(StringIO(csv_file.read().decode('utf-8')))
-        missing_cols = [col_name for col_name in CSV_SENSOR_MAP.values() if col_name not in csv.columns.values]
+        # The C parser decodes the raw bytes incrementally, the upload is never decoded as a whole
+        csv_stream = csv_file.stream
+        header = pandas.read_csv(csv_stream, nrows=0, encoding='utf-8')
+        missing_cols = [col_name for col_name in CSV_SENSOR_COLUMNS if col_name not in header.columns]
         if missing_cols:
             raise OBDControllerError(f'CSV is missing the following columns: {", ".join(missing_cols)}')
 
-        csv = csv[CSV_SENSOR_MAP.values()]
-        start_datetime = self._resolve_date_from_csv_row(csv.iloc[0])
-        gen_session_id = str(start_datetime.timestamp()).replace('.', '')[:12]
+        csv_stream.seek(0)
+        reader = self._read_csv_chunks(csv_stream)
+        first_chunk = next(reader, None)
+        if first_chunk is None or first_chunk.empty:
+            raise OBDControllerError('CSV does not contain any sensor readings')
+
+        start_datetime = self._resolve_date_from_csv_row(first_chunk.iloc[0])
+        # 10 µs resolution keeps the id within the 15 characters of OBDSession.id
+        gen_session_id = str((start_datetime - EPOCH) // datetime.timedelta(microseconds=10))
+        # Id format used before the current one, still checked so that re-uploaded files are not imported twice
+        legacy_session_id = str(start_datetime.timestamp()).replace('.', '')[:12]
 
-        if self.db_session.query(OBDSession).filter(OBDSession.id == gen_session_id).first():
+        session_ids = [gen_session_id, legacy_session_id]
+        if self.db_session.query(exists().where(OBDSession.id.in_(session_ids))).scalar():
             return
 
         session = OBDSession.create(self.db_session, id=gen_session_id, user_id=user.id, date=start_datetime)
-        _ = CarState.create_from_csv(self.db_session, session, csv)
+        for chunk in itertools.chain([first_chunk], reader):
+            CarState.create_from_csv(self.db_session, session, chunk)
         self.db_session.commit()
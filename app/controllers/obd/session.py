@@ -32,25 +32,29 @@ class SessionController(BaseUserController):
             else [OBDSession]
         )
 
-    def get(self, id: str, fields: List[str] = None):
+    def get(self, id: str, fields: List[str] = None, with_states: bool = False):
         """
         Returns an OBDSession instance based on its id and the current user.
 
         Args:
             - id (int): Id of the target OBDSession.
             - fields (List[str]): List of fields to project.
+            - with_states (bool): Whether to load the car states of the session along with it.
 
         Returns:
             - (app.models.obd.session.OBDSession | None): An OBDSession instance, if any is found. None otherwise.
         """
-        return (
+        query = (
             self.db_session.query(*self._resolve_query(fields))
                             .filter(
                                 OBDSession.id == id,
                                 OBDSession.user_id == self.user_id,
                             )
-                            .first()
         )
+        if with_states:
+            query = query.options(selectinload(OBDSession.car_states))
+
+        return query.first()
 
     def get_all(self, fields: List[str] = None):
         """
@@ -74,6 +78,7 @@ class SessionController(BaseUserController):
         """
         Will look for an OBDSession record within the database based on <id> and the current user.
         If the record is not found, will create one and return it.
+        New records are only added to the database session, committing them is up to the caller.
 
         Args:
             - id (int): Id of the target OBDSession.
@@ -85,7 +90,6 @@ class SessionController(BaseUserController):
         if not session:
             session = OBDSession(user_id=self.user_id, id=id)
             self.db_session.add(session)
-            self.db_session.commit()
 
         return session
 
@@ -186,7 +190,7 @@ class SessionController(BaseUserController):
             self.db_session.query(OBDSession)
                             .filter(OBDSession.user_id == self.user_id)
                             .order_by(OBDSession.date.asc())
-                            .options(selectinload('car_states'))
+                            .options(selectinload(OBDSession.car_states))
         )
 
         items = []
@@ -65,7 +65,7 @@ def setup_logging():
         'loggers': {
             '': {
                 'handlers': ['console'],
-                'level': 'DEBUG',
+                'level': Config.LOG_LEVEL,
                 'propagate': False,
             },
             'werkzeug': {
@@ -13,7 +13,8 @@ class DictDataModel(object):
 
     def to_dict(self, include_protected=False):
         columns = [x.name for x in self.__table__.columns]
-        restricted_fields = (self.private_fields + self.protected_fields)
+        protected_fields = set(self.protected_fields)
+        restricted_fields = protected_fields.union(self.private_fields)
         data = {
             key: getattr(self, key) for key in columns
             if key not in restricted_fields
@@ -21,6 +22,6 @@ class DictDataModel(object):
         if include_protected:
             data.update({
                 key: getattr(self, key) for key in columns
-                if key in self.protected_fields
+                if key in protected_fields
             })
         return data
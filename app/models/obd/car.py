@@ -2,14 +2,16 @@
 Car State Model Definitions.
 """
 import datetime
+import pandas
 
+from io import StringIO
 from pandas import DataFrame
 from structlog import get_logger
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Numeric, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, Numeric, DateTime, text
 from sqlalchemy.orm import relationship
 
-from app.constants.obd import CSV_SENSOR_MAP, CarSensorID
+from app.constants.obd import CSV_DATE_COLUMN, CSV_DATE_FORMAT, CSV_SENSOR_MAP, CarSensorID
 from app.database import DATABASE
 from app.models import DictDataModel
 from app.models.obd.session import OBDSession
@@ -22,6 +24,13 @@ class Acceletometer(DATABASE.Model, DictDataModel):
     """ Acceletometer-specific model """
     __tablename__ = 'acceletometer_state'
 
+    sensor_fields = {
+        'total': CarSensorID.Accelerometer.TOTAL,
+        'x': CarSensorID.Accelerometer.X,
+        'y': CarSensorID.Accelerometer.Y,
+        'z': CarSensorID.Accelerometer.Z,
+    }
+
     id = Column(Integer, primary_key=True)
     x = Column(Numeric, nullable=False)
     y = Column(Numeric, nullable=False)
@@ -33,6 +42,15 @@ class Engine(DATABASE.Model, DictDataModel):
     """ Engine-specific model """
     __tablename__ = 'engine_state'
 
+    sensor_fields = {
+        'coolant_temp': CarSensorID.Engine.COOLANT_TEMP,
+        'load': CarSensorID.Engine.LOAD,
+        'intake_air_temp': CarSensorID.Engine.INTAKE_AIR_TEMP,
+        'maf': CarSensorID.Engine.MAF,
+        'map': CarSensorID.Engine.MAP,
+        'rpm': CarSensorID.Engine.RPM,
+    }
+
     id = Column(Integer, primary_key=True)
     coolant_temp = Column(Numeric, nullable=False)
     load = Column(Numeric, nullable=False)
@@ -46,6 +64,13 @@ class Fuel(DATABASE.Model, DictDataModel):
     """ Fuel-specific model """
     __tablename__ = 'fuel_state'
 
+    sensor_fields = {
+        'cmd_equivalence_ratio': CarSensorID.Fuel.LAMBDA,
+        'level': CarSensorID.Fuel.LEVEL,
+        'ratio': CarSensorID.Fuel.RATIO,
+        'used': CarSensorID.Fuel.USED,
+    }
+
     id = Column(Integer, primary_key=True)
     cmd_equivalence_ratio = Column(Numeric, nullable=False)
     level = Column(Numeric, nullable=False)
@@ -57,6 +82,11 @@ class GPSReading(DATABASE.Model, DictDataModel):
     """ Readings for GPS data from OBD sensors. """
     __tablename__ = 'gps_location'
 
+    sensor_fields = {
+        'lat': CarSensorID.GPS.LATITUDE,
+        'lng': CarSensorID.GPS.LONGITUDE,
+    }
+
     id = Column(Integer, primary_key=True)
     lat = Column(Numeric, nullable=False)
     lng = Column(Numeric, nullable=False)
@@ -69,6 +99,12 @@ class CarState(DATABASE.Model, DictDataModel):
     """ Representation of the car measures from a certain point in time """
     __tablename__ = 'car_state'
 
+    sensor_fields = {
+        'speed': CarSensorID.SPEED,
+        'voltage': CarSensorID.VOLTAGE,
+        'throttle_position': CarSensorID.THROTTLE_POSITION,
+    }
+
     id = Column(Integer, primary_key=True)
     session_id = Column(String, ForeignKey(OBDSession.id))
     acceletometer_id = Column(Integer, ForeignKey(Acceletometer.id))
@@ -128,86 +164,133 @@ class CarState(DATABASE.Model, DictDataModel):
             'fuel_used': self.fuel.used,
         }
 
+    @staticmethod
+    def _reserve_ids(connection, model, count: int):
+        """
+        Reserves <count> ids from the sequence backing the primary key of <model>.
+        Only available on PostgreSQL.
+
+        Returns:
+            - (List[int]): Reserved ids.
+        """
+        result = connection.execute(
+            text('SELECT nextval(pg_get_serial_sequence(:table, :column)) FROM generate_series(1, :count)'),
+            table=model.__tablename__,
+            column='id',
+            count=count,
+        )
+        return [row[0] for row in result]
+
+    @staticmethod
+    def _copy_frame(connection, table_name: str, frame: DataFrame):
+        """
+        Streams the rows of <frame> into <table_name> through PostgreSQL's COPY.
+        Frame columns must be named after the table columns.
+        """
+        buffer = StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+
+        columns = ', '.join(f'"{column}"' for column in frame.columns)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY "{table_name}" ({columns}) FROM STDIN WITH CSV', buffer)
+
+    @classmethod
+    def _copy_from_frames(cls, db_session, sensor_frames: dict, states: DataFrame):
+        """
+        Writes sensor records and car states through COPY (PostgreSQL only).
+        Sensor ids are reserved upfront from their sequences, so states can reference them without reading them back.
+
+        Args:
+            - sensor_frames (dict): Map of car state foreign key columns to (model, DataFrame) pairs;
+            - states (pandas.DataFrame): Car state columns, except sensor foreign keys.
+        """
+        connection = db_session.connection()
+        for column, (model, frame) in sensor_frames.items():
+            ids = cls._reserve_ids(connection, model, len(frame))
+            cls._copy_frame(connection, model.__tablename__, frame.assign(id=ids))
+            states[column] = ids
+
+        cls._copy_frame(connection, cls.__tablename__, states)
+
+    @classmethod
+    def _insert_from_frames(cls, db_session, sensor_frames: dict, states: DataFrame):
+        """
+        Writes sensor records through <bulk_insert_mappings> (their ids are needed as foreign keys)
+        and car states through a single Core INSERT executed with the whole batch of parameters.
+
+        Args:
+            - sensor_frames (dict): Map of car state foreign key columns to (model, DataFrame) pairs;
+            - states (pandas.DataFrame): Car state columns, except sensor foreign keys.
+        """
+        for column, (model, frame) in sensor_frames.items():
+            records = frame.to_dict(orient='records')
+            db_session.bulk_insert_mappings(model, records, return_defaults=True)
+            states[column] = [record['id'] for record in records]
+
+        dates = states.pop('date').dt.to_pydatetime()
+        car_states = [dict(state, date=date) for state, date in zip(states.to_dict(orient='records'), dates)]
+        db_session.execute(cls.__table__.insert(), car_states)
+
     @classmethod
     def create_from_csv(cls, db_session, session: OBDSession, csv: DataFrame):
         """
-        Creates a list of instances from a TORQUE generated CSV.
+        Creates records from a TORQUE generated CSV.
+        Values are converted column-wise and written in bulk: through COPY on PostgreSQL,
+        through batched INSERTs otherwise.
 
         Args:
-            - session (app.models.obd.session.OBDSession): Current session to attach instance to;
+            - session (app.models.obd.session.OBDSession): Current session to attach records to;
             - csv (pandas.DataFrame): DataFrame representation of TORQUE generated CSV.
 
         Returns:
-            - (List[cls]): List of created instances.
+            - (int): Number of car states created.
         """
-        def row_value(row, key):
-            value = row[CSV_SENSOR_MAP[key]]
-            return value if value != '-' else 0
-
-        car_states = []
-        for _, row in csv.iterrows():
-            try:
-                acceletometer = Acceletometer(
-                    total=row_value(row, CarSensorID.Accelerometer.TOTAL),
-                    x=row_value(row, CarSensorID.Accelerometer.X),
-                    y=row_value(row, CarSensorID.Accelerometer.Y),
-                    z=row_value(row, CarSensorID.Accelerometer.Z),
-                )
-                db_session.add(acceletometer)
-
-                fuel = Fuel(
-                    cmd_equivalence_ratio=row_value(row, CarSensorID.Fuel.LAMBDA),
-                    level=row_value(row, CarSensorID.Fuel.LEVEL),
-                    ratio=row_value(row, CarSensorID.Fuel.RATIO),
-                    used=row_value(row, CarSensorID.Fuel.USED),
-                )
-                db_session.add(fuel)
-
-                engine = Engine(
-                    coolant_temp=row_value(row, CarSensorID.Engine.COOLANT_TEMP),
-                    load=row_value(row, CarSensorID.Engine.LOAD),
-                    intake_air_temp=row_value(row, CarSensorID.Engine.INTAKE_AIR_TEMP),
-                    maf=row_value(row, CarSensorID.Engine.MAF),
-                    map=row_value(row, CarSensorID.Engine.MAP),
-                    rpm=row_value(row, CarSensorID.Engine.RPM),
-                )
-                db_session.add(engine)
-
-                gps = GPSReading(
-                    lat=row_value(row, CarSensorID.GPS.LATITUDE),
-                    lng=row_value(row, CarSensorID.GPS.LONGITUDE),
-                )
-                db_session.add(gps)
-
-                db_session.flush()
-
-                date_str = row_value(row, CarSensorID.DATE)
-                date = datetime.datetime.strptime(date_str, '%d-%b-%Y %H:%M:%S.%f')
-                curr_state = cls(
-                    acceletometer_id=acceletometer.id,
-                    engine_id=engine.id,
-                    fuel_id=fuel.id,
-                    gps_id=gps.id,
-                    session_id=session.id,
-                    date=date,
-                    speed=row_value(row, CarSensorID.SPEED),
-                    voltage=row_value(row, CarSensorID.VOLTAGE),
-                    throttle_position=row_value(row, CarSensorID.THROTTLE_POSITION),
-                    timestamp=str(date.timestamp()).replace('.', '')[:13],
-                )
-                db_session.add(curr_state)
-                db_session.flush()
-            except Exception as err:
-                LOGGER.error('TORQUE: Could not save car state', error=str(err))
-            else:
-                car_states.append(curr_state)
-
-        return car_states
+        dates = pandas.to_datetime(
+            csv[CSV_DATE_COLUMN],
+            format=CSV_DATE_FORMAT,
+            errors='coerce',
+            cache=True,
+        )
+        invalid_dates = dates.isna()
+        if invalid_dates.any():
+            LOGGER.error('TORQUE: Could not resolve car state date', skipped_rows=int(invalid_dates.sum()))
+            csv, dates = csv[~invalid_dates], dates[~invalid_dates]
+
+        if csv.empty:
+            return 0
+
+        csv = csv.fillna(0)
+
+        def frame(model):
+            columns = {CSV_SENSOR_MAP[sensor_id]: field for field, sensor_id in model.sensor_fields.items()}
+            return csv[list(columns)].rename(columns=columns)
+
+        sensor_frames = {
+            'acceletometer_id': (Acceletometer, frame(Acceletometer)),
+            'engine_id': (Engine, frame(Engine)),
+            'fuel_id': (Fuel, frame(Fuel)),
+            'gps_id': (GPSReading, frame(GPSReading)),
+        }
+        states = frame(cls).assign(
+            session_id=session.id,
+            date=dates,
+            # Naive device times are read as UTC, the same convention used for CSV session ids
+            timestamp=(dates.astype('int64') // 10**6).astype(str),
+        )
+
+        if db_session.get_bind().dialect.name == 'postgresql':
+            cls._copy_from_frames(db_session, sensor_frames, states)
+        else:
+            cls._insert_from_frames(db_session, sensor_frames, states)
+
+        return len(states)
 
     @classmethod
     def create_from_torque(cls, db_session, session: OBDSession, data: dict):
         """
         Creates an instance from TORQUE's request data.
+        The state and its sensor records are written in a single flush, committing them is up to the caller.
 
         Args:
             - session (app.models.obd.session.OBDSession): Current session to attach instance to;
@@ -217,51 +300,18 @@ class CarState(DATABASE.Model, DictDataModel):
         Returns:
             - (cls | None): An instance of <cls>, if able to resolve sensor data from the request. Otherwise, None.
         """
-        try:
-            acceletometer = Acceletometer(
-                total=data.get(CarSensorID.Accelerometer.TOTAL, 0),
-                x=data.get(CarSensorID.Accelerometer.X, 0),
-                y=data.get(CarSensorID.Accelerometer.Y, 0),
-                z=data.get(CarSensorID.Accelerometer.Z, 0),
-            )
-            db_session.add(acceletometer)
-
-            fuel = Fuel(
-                cmd_equivalence_ratio=data.get(CarSensorID.Fuel.LAMBDA, 0),
-                level=data.get(CarSensorID.Fuel.LEVEL, 0),
-                ratio=data.get(CarSensorID.Fuel.RATIO, 0),
-                used=data.get(CarSensorID.Fuel.USED, 0),
-            )
-            db_session.add(fuel)
-
-            engine = Engine(
-                coolant_temp=data.get(CarSensorID.Engine.COOLANT_TEMP, 0),
-                load=data.get(CarSensorID.Engine.LOAD, 0),
-                intake_air_temp=data.get(CarSensorID.Engine.INTAKE_AIR_TEMP, 0),
-                maf=data.get(CarSensorID.Engine.MAF, 0),
-                map=data.get(CarSensorID.Engine.MAP, 0),
-                rpm=data.get(CarSensorID.Engine.RPM, 0),
-            )
-            db_session.add(engine)
-
-            gps = GPSReading(
-                lat=data.get(CarSensorID.GPS.LATITUDE, 0),
-                lng=data.get(CarSensorID.GPS.LONGITUDE, 0),
-            )
-            db_session.add(gps)
-
-            db_session.flush()
+        def values(model):
+            return {field: data.get(sensor_id, 0) for field, sensor_id in model.sensor_fields.items()}
 
+        try:
             car_state = cls(
-                acceletometer_id=acceletometer.id,
-                engine_id=engine.id,
-                fuel_id=fuel.id,
-                gps_id=gps.id,
+                acceletometer=Acceletometer(**values(Acceletometer)),
+                engine=Engine(**values(Engine)),
+                fuel=Fuel(**values(Fuel)),
+                gps=GPSReading(**values(GPSReading)),
                 session_id=session.id,
-                speed=data.get(CarSensorID.SPEED, 0),
-                voltage=data.get(CarSensorID.VOLTAGE, 0),
-                throttle_position = data.get(CarSensorID.THROTTLE_POSITION, 0),
                 timestamp=data[CarSensorID.TIMESTAMP],
+                **values(cls),
             )
             db_session.add(car_state)
             db_session.flush()
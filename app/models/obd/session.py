@@ -4,7 +4,7 @@ OBD Session.
 import math
 import datetime
 
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, DateTime
 from sqlalchemy.orm import relationship
 
 from app.database import DATABASE
@@ -15,6 +15,9 @@ from app.models.user import User
 class OBDSession(DATABASE.Model, DictDataModel):
     """ Readings for GPS data from OBD sensors. """
     __tablename__ = "obd_session"
+    __table_args__ = (
+        Index('ix_obd_session_user_date', 'user_id', 'date'),
+    )
 
     protected_fields = ['user_id']
 
@@ -24,7 +27,9 @@ class OBDSession(DATABASE.Model, DictDataModel):
 
     user = relationship(User, uselist=False)
 
-    car_states = relationship('CarState', uselist=True)
+    # Loading states must be explicit (e.g. selectinload), so they are never fetched by accident.
+    # States are always written through CarState.session_id, so flushes can skip this side entirely.
+    car_states = relationship('CarState', uselist=True, lazy='raise', viewonly=True)
 
     @property
     def states(self):
@@ -74,7 +74,7 @@ def register_line_graph_callbacks(dash_app):
         Returns:
             - (dict): Generated line graph figure.
         """
-        session = get_session_controller().get(session_id).to_flat_data()
+        session = get_session_controller().get(session_id, with_states=True).to_flat_data()
         car_states = session['car_states']
         indexes = [idx for idx, _ in enumerate(car_states)]
 
@@ -1,7 +1,7 @@
 """
 User validation schemas.
 """
-from marshmallow import Schema
+from marshmallow import pre_load, Schema
 from marshmallow.fields import Email, Str
 from marshmallow.validate import Length
 
@@ -9,3 +9,9 @@ from marshmallow.validate import Length
 class LoginSchema(Schema):
     email = Email(required=True)
     password = Str(required=True, validate=Length(min=8))
+
+    @pre_load
+    def make_data(self, data, **kwargs):
+        if isinstance(data, dict) and isinstance(data.get('email'), str):
+            data['email'] = data['email'].lower().strip()
+        return data
@@ -50,7 +50,7 @@ class SessionViews:
     @auth_required
     def session_get_view(user, session_id):
         """ Retrieves complete data package on a certain session for the current user """
-        session = SessionController(user_id=user.id).get(session_id)
+        session = SessionController(user_id=user.id).get(session_id, with_states=True)
         if not session:
             response = jsonify({'message': 'Unable to find session'})
             response.status_code = 404
@@ -63,7 +63,7 @@ class SessionViews:
     @auth_required
     def session_get_profile_view(user, session_id):
         """ Retrieves complete data package on a certain session for the current user """
-        session = SessionController(user_id=user.id).get(session_id)
+        session = SessionController(user_id=user.id).get(session_id, with_states=True)
         if not session:
             response = jsonify({'message': 'Unable to find session'})
             response.status_code = 404